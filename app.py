@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+from flask import Flask, render_template, request, redirect, url_for, session, send_file, send_from_directory, abort, jsonify
 import os
 import base64
 from werkzeug.utils import secure_filename
@@ -6,7 +6,8 @@ import torch
 from services.text_service import detect_text_fraud, is_model_loading
 from services.audio_service import detect_audio_fraud
 from services.image_service import detect_image_fraud
-from services.video_service import detect_video_fraud
+from services.video_service import detect_video_fraud, save_frame_details, frame_details_path
+from services.profiling_service import profiled, require_admin_token, list_traces
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -19,6 +20,17 @@ os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'audio'), exist_ok=True)
 os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'image'), exist_ok=True)
 os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'video'), exist_ok=True)
 
+# Per-frame video results are kept on disk, not in the session
+app.config['VIDEO_RESULTS_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'video_results')
+os.makedirs(app.config['VIDEO_RESULTS_FOLDER'], exist_ok=True)
+
+# Opt-in profiling of /detect/* requests (off unless enabled here or via env)
+app.config['PROFILE_FOLDER'] = os.environ.get('PROFILE_FOLDER', 'profiles')
+app.config['PROFILE_ON_REQUEST'] = os.environ.get('PROFILE_ON_REQUEST', '0') == '1'  # Honor X-Profile header / ?profile=1
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))  # Fraction of requests to profile
+app.config['PROFILE_MAX_BYTES'] = int(os.environ.get('PROFILE_MAX_BYTES', 200 * 1024 * 1024))  # 200MB of traces max
+app.config['PROFILE_ADMIN_TOKEN'] = os.environ.get('PROFILE_ADMIN_TOKEN')  # /admin/profiles is disabled when unset
+
 # Check if GPU is available
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 print(f"Using device: {device}")
@@ -52,6 +64,7 @@ def index():
                          image_preview=image_preview)
 
 @app.route('/detect/text', methods=['POST'])
+@profiled
 def detect_text():
     try:
         tab = request.form.get('tab', 'text')
@@ -114,6 +127,7 @@ def detect_text():
         return redirect(url_for('index'))
 
 @app.route('/detect/audio', methods=['POST'])
+@profiled
 def detect_audio():
     try:
         tab = request.form.get('tab', 'audio')
@@ -151,6 +165,7 @@ def detect_audio():
         return redirect(url_for('index'))
 
 @app.route('/detect/image', methods=['POST'])
+@profiled
 def detect_image():
     try:
         tab = request.form.get('tab', 'image')
@@ -193,6 +208,7 @@ def detect_image():
         return redirect(url_for('index'))
 
 @app.route('/detect/video', methods=['POST'])
+@profiled
 def detect_video():
     try:
         tab = request.form.get('tab', 'video')
@@ -214,6 +230,9 @@ def detect_video():
             
             try:
                 result = detect_video_fraud(filepath, device)
+                frame_data = result.pop('frame_data', None)
+                if frame_data is not None:
+                    result['result_id'] = save_frame_details(frame_data, app.config['VIDEO_RESULTS_FOLDER'])
                 session['video_result'] = result
             except Exception as e:
                 app.logger.error(f"Error in video detection: {str(e)}")
@@ -229,5 +248,26 @@ def detect_video():
         session['video_result'] = {'error': str(e)}
         return redirect(url_for('index'))
 
+@app.route('/detect/video/frames/<result_id>', methods=['GET'])
+def video_frames(result_id):
+    # Full per-frame detail as a .npz of columns (timestamps, real_scores, fake_scores, is_fake)
+    path = frame_details_path(app.config['VIDEO_RESULTS_FOLDER'], result_id)
+    if path is None:
+        abort(404)
+    return send_file(os.path.abspath(path),
+                     mimetype='application/octet-stream',
+                     as_attachment=True,
+                     download_name=f'{result_id}.npz')
+
+@app.route('/admin/profiles', methods=['GET'])
+@require_admin_token
+def admin_profiles():
+    return jsonify(list_traces(app.config['PROFILE_FOLDER']))
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+@require_admin_token
+def admin_profile_download(name):
+    return send_from_directory(os.path.abspath(app.config['PROFILE_FOLDER']), name, as_attachment=True)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,218 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from functools import wraps
+from flask import current_app, request, abort
+import torch
+from torch.profiler import profile, ProfilerActivity
+
+# Header and query flag that request a profile for a single request
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_ARG = 'profile'
+
+# Header carrying the token for the /admin/profiles endpoints
+ADMIN_TOKEN_HEADER = 'X-Profile-Token'
+
+# Extensions of the files written for each profiled request
+TRACE_EXTENSIONS = ('.json', '.prof', '.txt')
+
+# torch.profiler and cProfile are process-wide, so only one request is
+# profiled at a time
+profile_lock = threading.Lock()
+
+def should_profile():
+    """
+    Decide whether the current request should be profiled
+
+    Returns:
+        bool: True if the request asked for it or was sampled
+    """
+    config = current_app.config
+
+    if config.get('PROFILE_ON_REQUEST'):
+        flag = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_ARG)
+        if flag and flag.lower() in ('1', 'true', 'yes'):
+            return True
+
+    sample_rate = config.get('PROFILE_SAMPLE_RATE', 0)
+    return sample_rate > 0 and random.random() < sample_rate
+
+def list_traces(directory):
+    """
+    List trace files, newest first
+
+    Args:
+        directory (str): Directory the traces are stored in
+
+    Returns:
+        list: List of dicts with name, size and modification time
+    """
+    if not os.path.isdir(directory):
+        return []
+
+    traces = []
+    for name in os.listdir(directory):
+        if not name.endswith(TRACE_EXTENSIONS):
+            continue
+        path = os.path.join(directory, name)
+        traces.append({
+            "name": name,
+            "size": os.path.getsize(path),
+            "modified": os.path.getmtime(path)
+        })
+
+    traces.sort(key=lambda trace: trace["modified"], reverse=True)
+    return traces
+
+def prune_traces(directory, max_bytes):
+    """
+    Delete the oldest traces until the directory fits in max_bytes
+
+    Files of one request share a base name and are deleted together. The
+    newest trace is always kept.
+
+    Args:
+        directory (str): Directory the traces are stored in
+        max_bytes (int): Maximum total size of the trace files
+    """
+    # Group the files of each request by base name
+    groups = {}
+    for trace in list_traces(directory):
+        base = os.path.splitext(trace["name"])[0]
+        group = groups.setdefault(base, {"names": [], "size": 0, "modified": 0})
+        group["names"].append(trace["name"])
+        group["size"] += trace["size"]
+        group["modified"] = max(group["modified"], trace["modified"])
+
+    groups = sorted(groups.values(), key=lambda group: group["modified"], reverse=True)
+    total = sum(group["size"] for group in groups)
+
+    while len(groups) > 1 and total > max_bytes:
+        group = groups.pop()
+        for name in group["names"]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+        total -= group["size"]
+
+    if total > max_bytes:
+        current_app.logger.warning(f"Profile trace is {total} bytes, over the {max_bytes} byte limit")
+
+def write_traces(directory, name, torch_profiler, cpu_profiler):
+    """
+    Write a Chrome trace, raw pstats dump and pstats text summary
+
+    Args:
+        directory (str): Directory to write the traces to
+        name (str): Base file name shared by the three files
+        torch_profiler (torch.profiler.profile): Finished torch profiler
+        cpu_profiler (cProfile.Profile): Finished cProfile profiler
+    """
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, name)
+
+    torch_profiler.export_chrome_trace(base + '.json')
+    cpu_profiler.dump_stats(base + '.prof')
+
+    summary = io.StringIO()
+    stats = pstats.Stats(cpu_profiler, stream=summary)
+    stats.sort_stats('cumulative').print_stats(50)
+    with open(base + '.txt', 'w', encoding='utf-8') as f:
+        f.write(summary.getvalue())
+
+def run_profiled(view, args, kwargs):
+    """
+    Call a view under torch.profiler and cProfile and write its traces
+
+    If a profiler fails to start or stop, the error is logged and the
+    view's response is returned as usual.
+    """
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+
+    torch_profiler = profile(activities=activities, record_shapes=True)
+    cpu_profiler = cProfile.Profile()
+    try:
+        torch_profiler.start()
+        try:
+            cpu_profiler.enable()
+        except Exception:
+            torch_profiler.stop()
+            raise
+    except Exception as e:
+        current_app.logger.error(f"Error starting profiler: {str(e)}")
+        return view(*args, **kwargs)
+
+    stopped = False
+    try:
+        response = view(*args, **kwargs)
+    finally:
+        try:
+            cpu_profiler.disable()
+            torch_profiler.stop()
+            stopped = True
+        except Exception as e:
+            current_app.logger.error(f"Error stopping profiler: {str(e)}")
+
+    if stopped:
+        config = current_app.config
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{request.endpoint}_{uuid.uuid4().hex[:8]}"
+        try:
+            write_traces(config['PROFILE_FOLDER'], name, torch_profiler, cpu_profiler)
+            prune_traces(config['PROFILE_FOLDER'], config['PROFILE_MAX_BYTES'])
+        except Exception as e:
+            current_app.logger.error(f"Error writing profile traces: {str(e)}")
+
+    return response
+
+def profiled(view):
+    """
+    Profile a view with torch.profiler and cProfile when requested
+
+    The request is profiled if PROFILE_ON_REQUEST is set and the client
+    sends the X-Profile header or ?profile=1, or if it is picked by
+    PROFILE_SAMPLE_RATE. Otherwise, or while another request is being
+    profiled, the view is called directly.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not should_profile():
+            return view(*args, **kwargs)
+
+        if not profile_lock.acquire(blocking=False):
+            return view(*args, **kwargs)
+        try:
+            return run_profiled(view, args, kwargs)
+        finally:
+            profile_lock.release()
+
+    return wrapper
+
+def require_admin_token(view):
+    """
+    Restrict a view to clients sending PROFILE_ADMIN_TOKEN
+
+    Returns 404 when no token is configured and 403 when the
+    X-Profile-Token header does not match.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('PROFILE_ADMIN_TOKEN')
+        if not token:
+            abort(404)
+
+        supplied = request.headers.get(ADMIN_TOKEN_HEADER, '')
+        if not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+            abort(403)
+
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -2,9 +2,16 @@ import cv2
 import torch
 import numpy as np
 import os
+import uuid
 import tempfile
 from services.image_service import detect_image_fraud
 
+# Number of points kept in the display timeline
+TIMELINE_POINTS = 100
+
+# Number of per-frame detail files kept on disk
+MAX_STORED_DETAILS = 50
+
 def extract_frames(video_path, interval=5):
     """
     Extract frames from video at specified interval
@@ -14,7 +21,7 @@ def extract_frames(video_path, interval=5):
         interval (int): Extract 1 frame every N seconds
         
     Returns:
-        list: List of extracted frame paths
+        tuple: List of extracted frame paths and their timestamps in seconds
     """
     # Create temp directory for frames
     temp_dir = tempfile.mkdtemp()
@@ -32,6 +39,7 @@ def extract_frames(video_path, interval=5):
     
     # Extract frames
     frame_paths = []
+    timestamps = []
     for i, frame_idx in enumerate(frame_indices):
         cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
         ret, frame = cap.read()
@@ -39,11 +47,133 @@ def extract_frames(video_path, interval=5):
             frame_path = os.path.join(temp_dir, f"frame_{i:04d}.jpg")
             cv2.imwrite(frame_path, frame)
             frame_paths.append(frame_path)
+            timestamps.append(frame_idx / fps)
     
     # Release video
     cap.release()
     
-    return frame_paths
+    return frame_paths, timestamps
+
+def longest_run(mask):
+    """
+    Length of the longest run of True values in a boolean array
+    
+    Args:
+        mask (np.ndarray): Boolean array
+        
+    Returns:
+        int: Longest run length
+    """
+    if not mask.any():
+        return 0
+    
+    # Run boundaries are where the padded mask changes value
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return int((ends - starts).max())
+
+def downsample_timeline(timestamps, fake_scores, points=TIMELINE_POINTS):
+    """
+    Reduce per-frame scores to at most `points` buckets for display
+    
+    Args:
+        timestamps (np.ndarray): Frame timestamps in seconds
+        fake_scores (np.ndarray): Per-frame fake scores
+        points (int): Maximum number of timeline points
+        
+    Returns:
+        list: List of [timestamp, fake_score] pairs
+    """
+    buckets = np.array_split(np.arange(len(fake_scores)), min(points, len(fake_scores)))
+    
+    # Keep the peak frame per bucket so short fake segments stay visible
+    timeline = []
+    for bucket in buckets:
+        scores = fake_scores[bucket]
+        if np.isnan(scores).all():
+            continue
+        peak = bucket[np.nanargmax(scores)]
+        timeline.append([round(float(timestamps[peak]), 2),
+                         round(float(fake_scores[peak]), 4)])
+    return timeline
+
+def summarize_scores(timestamps, fake_scores, is_fake):
+    """
+    Summary statistics over per-frame fake scores
+    
+    Args:
+        timestamps (np.ndarray): Frame timestamps in seconds
+        fake_scores (np.ndarray): Per-frame fake scores (NaN for failed frames)
+        is_fake (np.ndarray): Per-frame fake verdicts
+        
+    Returns:
+        dict: Mean, max, percentiles and longest fake run
+    """
+    valid = fake_scores[~np.isnan(fake_scores)]
+    if len(valid) == 0:
+        return {}
+    
+    p50, p90, p95 = np.percentile(valid, [50, 90, 95])
+    run = longest_run(is_fake)
+    interval = float(np.median(np.diff(timestamps))) if len(timestamps) > 1 else 0.0
+    
+    return {
+        "mean_score": round(float(valid.mean()), 4),
+        "max_score": round(float(valid.max()), 4),
+        "p50_score": round(float(p50), 4),
+        "p90_score": round(float(p90), 4),
+        "p95_score": round(float(p95), 4),
+        "longest_fake_run": run,
+        "longest_fake_run_seconds": round(run * interval, 2)
+    }
+
+def save_frame_details(frame_data, directory):
+    """
+    Store per-frame arrays as a compressed .npz file
+    
+    Args:
+        frame_data (dict): Column name to numpy array
+        directory (str): Directory to store the file in
+        
+    Returns:
+        str: Result id for retrieving the file
+    """
+    os.makedirs(directory, exist_ok=True)
+    result_id = uuid.uuid4().hex
+    np.savez_compressed(os.path.join(directory, f"{result_id}.npz"), **frame_data)
+    
+    # Drop the oldest files once over the retention limit
+    files = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.npz')),
+        key=os.path.getmtime
+    )
+    for path in files[:-MAX_STORED_DETAILS]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
+    return result_id
+
+def frame_details_path(directory, result_id):
+    """
+    Path of a stored per-frame detail file, or None if it does not exist
+    
+    Args:
+        directory (str): Directory the files are stored in
+        result_id (str): Result id returned by save_frame_details
+        
+    Returns:
+        str: Path to the .npz file, or None
+    """
+    try:
+        result_id = uuid.UUID(hex=result_id).hex
+    except ValueError:
+        return None
+    
+    path = os.path.join(directory, f"{result_id}.npz")
+    return path if os.path.exists(path) else None
 
 def detect_video_fraud(video_path, device):
     """
@@ -54,11 +184,12 @@ def detect_video_fraud(video_path, device):
         device (torch.device): Device to run inference on
         
     Returns:
-        dict: Result with prediction and confidence
+        dict: Result with prediction, confidence, score summary and
+            timeline. Full per-frame arrays are under "frame_data".
     """
     try:
         # Extract frames
-        frame_paths = extract_frames(video_path)
+        frame_paths, timestamps = extract_frames(video_path)
         
         if not frame_paths:
             return {
@@ -67,19 +198,26 @@ def detect_video_fraud(video_path, device):
                 "confidence": 0
             }
         
-        # Analyze each frame
-        frame_results = []
-        fake_count = 0
+        # Analyze each frame, keeping only the scores
+        frame_count = len(frame_paths)
+        real_scores = np.full(frame_count, np.nan, dtype=np.float32)
+        fake_scores = np.full(frame_count, np.nan, dtype=np.float32)
+        is_fake_frames = np.zeros(frame_count, dtype=bool)
         
-        for frame_path in frame_paths:
+        for i, frame_path in enumerate(frame_paths):
             result = detect_image_fraud(frame_path, device)
-            frame_results.append(result)
             
-            if result.get("is_fake", False):
-                fake_count += 1
+            raw_scores = result.get("raw_scores")
+            if raw_scores:
+                real_scores[i] = raw_scores["real_score"]
+                fake_scores[i] = raw_scores["fake_score"]
+            is_fake_frames[i] = result.get("is_fake", False)
+        
+        timestamps = np.asarray(timestamps, dtype=np.float32)
+        fake_count = int(is_fake_frames.sum())
         
         # Calculate percentage of fake frames
-        fake_percentage = (fake_count / len(frame_paths)) * 100
+        fake_percentage = (fake_count / frame_count) * 100
         
         # Determine overall verdict
         is_fake = fake_percentage > 10  # Consider fake if >10% frames are fake
@@ -87,11 +225,18 @@ def detect_video_fraud(video_path, device):
         result = {
             "is_fake": is_fake,
             "fake_percentage": round(fake_percentage, 2),
-            "frames_analyzed": len(frame_paths),
+            "frames_analyzed": frame_count,
             "fake_frames": fake_count,
             "prediction": "Likely deepfake" if is_fake else "Genuine",
             "confidence": round(fake_percentage if is_fake else (100 - fake_percentage), 2),
-            "frame_results": frame_results
+            "summary": summarize_scores(timestamps, fake_scores, is_fake_frames),
+            "timeline": downsample_timeline(timestamps, fake_scores),
+            "frame_data": {
+                "timestamps": timestamps,
+                "real_scores": real_scores,
+                "fake_scores": fake_scores,
+                "is_fake": is_fake_frames
+            }
         }
         
         # Clean up temporary files